@@ -1,18 +1,15 @@
 import logging
 import os
+import sys
 from enum import Enum
 from pathlib import Path
 
 import typer
-from rich import print
-from rich.console import Console
-from rich.logging import RichHandler
-from rich.table import Table
 
-from dnd_item import five_e
-from dnd_item.types import RollTable
-from dnd_item.weapons import WeaponGenerator
-from dnd_item.scrolls import ScrollGenerator
+# Everything else (rich, the yaml sources, the generators) is imported by the
+# command that needs it, so that --help and unrelated commands start quickly.
+
+SOURCES = Path(__file__).parent / Path("sources")
 
 app = typer.Typer()
 app_state = {}
@@ -28,30 +25,41 @@ class OUTPUT_FORMATS(Enum):
 def main(
     cr: int = typer.Option(default=None, help="The Challenge Rating to use when determining rarity."),
 ):
-    debug = os.getenv("FANITEM_DEBUG", None)
-    logging.basicConfig(
-        format="%(name)s %(message)s",
-        level=logging.DEBUG if debug else logging.INFO,
-        handlers=[RichHandler(rich_tracebacks=True, tracebacks_suppress=[typer])],
-    )
+    if os.getenv("FANITEM_DEBUG", None):
+        # rich tracebacks are only worth their setup cost when debugging.
+        from rich.logging import RichHandler
+
+        logging.basicConfig(
+            format="%(name)s %(message)s",
+            level=logging.DEBUG,
+            handlers=[RichHandler(rich_tracebacks=True, tracebacks_suppress=[typer])],
+        )
+    else:
+        logging.basicConfig(format="%(name)s %(message)s", level=logging.INFO)
     logging.getLogger("markdown_it").setLevel(logging.ERROR)
 
     app_state["cr"] = cr or 0
-    app_state["data"] = Path(__file__).parent / Path("sources")
+    app_state["data"] = SOURCES
 
 
 @app.command()
 def weapon(count: int = typer.Option(1, help="The number of weapons to generate.")):
-    console = Console()
-    for weapon in WeaponGenerator().random(count=count, challenge_rating=app_state["cr"]):
-        console.print(weapon.details)
+    from rich.console import Console
+
+    from dnd_item.weapons import WeaponGenerator
+
+    weapons = WeaponGenerator().random(count=count, challenge_rating=app_state["cr"])
+    Console().print("\n".join(weapon.details for weapon in weapons))
 
 
 @app.command()
 def scroll(count: int = typer.Option(1, help="The number of weapons to generate.")):
-    console = Console()
-    for scroll in ScrollGenerator().random(count=count, challenge_rating=app_state["cr"]):
-        console.print(scroll.details)
+    from rich.console import Console
+
+    from dnd_item.scrolls import ScrollGenerator
+
+    scrolls = ScrollGenerator().random(count=count, challenge_rating=app_state["cr"])
+    Console().print("\n".join(scroll.details for scroll in scrolls))
 
 
 @app.command("roll-table")
@@ -71,6 +79,12 @@ def table(
     """
     CLI for creating roll tables of randomly-generated items.
     """
+    from rich import print
+    from rich.table import Table
+
+    from dnd_item.types import RollTable
+    from dnd_item.weapons import WeaponGenerator
+
     rt = RollTable(
         sources=[WeaponGenerator],
         die=die,
@@ -92,5 +106,6 @@ def table(
 
 @app.command()
 def convert():
-    src = five_e.spells()
-    print(src.as_yaml)
+    from dnd_item import five_e
+
+    five_e.spells().dump(sys.stdout)
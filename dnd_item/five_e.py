@@ -1,23 +1,37 @@
-import json
+import copy
 import re
-from collections import defaultdict
+from functools import lru_cache
+from itertools import chain
 from pathlib import Path
+from types import MappingProxyType
 
+import orjson
 import yaml
 from random_sets.datasources import DataSource
 
+try:
+    from yaml import CSafeDumper as SafeDumper
+except ImportError:  # pragma: no cover; libyaml is not available
+    from yaml import SafeDumper
+
 sources = Path(__file__).parent / Path("sources")
 
-RARITY = {"unknown": "common", "none": "common", "": ""}
+# The look-up tables below are read-only views, so they can be shared safely
+# by the cached sources returned from weapons() and spells().
+RARITY = MappingProxyType({"unknown": "common", "none": "common", "": ""})
+
+TYPE = MappingProxyType({"M": "martial", "R": "ranged", "": ""})
 
-TYPE = {"M": "martial", "R": "ranged", "": ""}
+# RARITY and TYPE as they appear in converted sources
+RARITY_CAP = MappingProxyType({k: v.capitalize() for k, v in RARITY.items()})
+TYPE_CAP = MappingProxyType({k: v.capitalize() for k, v in TYPE.items()})
 
-DAMAGE = {"S": "Slashing", "P": "Piercing", "B": "Bludgeoning", "": ""}
+DAMAGE = MappingProxyType({"S": "Slashing", "P": "Piercing", "B": "Bludgeoning", "": ""})
 
-PROPERTIES = {
+PROPERTIES = MappingProxyType({
     "F": "finesse",
     "AF": "firearm",
-    "A": "ammmunition",
+    "A": "ammunition",
     "T": "thrown",
     "L": "light",
     "2H": "two-handed",
@@ -27,9 +41,9 @@ PROPERTIES = {
     "S": "special",
     "H": "heavy",
     "R": "reach",
-}
+})
 
-LEVEL = [
+LEVEL = (
     'cantrip',
     'first',
     'second',
@@ -40,9 +54,9 @@ LEVEL = [
     'seventh',
     'eighth',
     'ninth',
-]
+)
 
-SCHOOL = {
+SCHOOL = MappingProxyType({
     'A': 'Abjuration',
     'C': 'Conjuration',
     'D': 'Divination',
@@ -51,18 +65,55 @@ SCHOOL = {
     'N': 'Necromancy',
     'T': 'Transmutation',
     'V': 'Evocation',
-}
+})
+
+# Matches die rolls such as "2d6" in spell descriptions.
+DMG_DIE = re.compile(r'\d+d\d+')
+
+
+def _strings(obj):
+    """
+    Yield every string in an arbitrarily-nested structure of lists and dicts,
+    such as the 'entries' of a 5e.tools spell, in document order.
+    """
+    if type(obj) is str:
+        yield obj
+    elif type(obj) is list:
+        for member in obj:
+            yield from _strings(member)
+    elif type(obj) is dict:
+        for member in obj.values():
+            yield from _strings(member)
+
+
+class FiveEDataSource(DataSource):
+    """
+    Base class for data sources converted from 5e.tools json data files. The
+    source is the raw json, as bytes.
+    """
+
+    def dump(self, stream=None):
+        """
+        Serialize the source to the yaml format consumed by dnd-rolltables. If
+        a stream is supplied the yaml is written to it directly; otherwise it
+        is returned as a string.
+        """
+        return yaml.dump({"metadata": self.metadata, **self.data}, stream, Dumper=SafeDumper, sort_keys=False)
+
+    @property
+    def as_yaml(self) -> str:
+        return self.dump()
 
 
-class Weapons(DataSource):
+class Weapons(FiveEDataSource):
     """
     A rolltables data source backed by a 5e.tools json data file. used to
     convert the 5e.tools data to the yaml format consumed by dnd-rolltables.
     """
 
     def read_source(self) -> None:
-        src = json.load(self.source)["baseitem"]
-        self.data = defaultdict(list)
+        src = orjson.loads(self.source)["baseitem"]
+        self.data = {rarity: [] for rarity in ["Common", *RARITY_CAP.values()]}
         headers = [
             "Rarity",
             "Name",
@@ -82,9 +133,10 @@ class Weapons(DataSource):
                 continue
             if item.get("age", False):
                 continue
-            rarity = RARITY.get(item["rarity"], "Common").capitalize()
-            itype = TYPE.get(item["type"], "_unknown").capitalize()
-            properties = ", ".join([PROPERTIES[p] for p in item.get("property", [])])
+            rarity = RARITY_CAP.get(item["rarity"], "Common")
+            itype = TYPE_CAP.get(item["type"], "_unknown")
+            property_codes = item.get("property")
+            properties = ", ".join(map(PROPERTIES.__getitem__, property_codes)) if property_codes else ""
 
             self.data[rarity].append(
                 {
@@ -101,18 +153,15 @@ class Weapons(DataSource):
                     ]
                 }
             )
+        self.data = {key: members for key, members in self.data.items() if members}
         self.metadata = {"headers": headers}
 
-    @property
-    def as_yaml(self) -> str:
-        return yaml.dump({"metadata": self.metadata}) + yaml.dump(dict(self.data))
-
 
-class Spells(DataSource):
+class Spells(FiveEDataSource):
 
     def read_source(self) -> None:
-        src = json.load(self.source)['spell']
-        self.data = defaultdict(list)
+        src = orjson.loads(self.source)['spell']
+        self.data = {level: [] for level in LEVEL}
 
         headers = [
             "Level",
@@ -125,9 +174,8 @@ class Spells(DataSource):
             "Material Cost",
         ]
 
-        dmg_die = re.compile(r'\d+d\d+')
-
-        for spell in sorted(src, key=lambda x: int(x['level'])):
+        # self.data is keyed by level in LEVEL order, so there is no need to sort src.
+        for spell in src:
             distance = ""
             if spell["range"]["type"] == "special":
                 distance = "special"
@@ -139,10 +187,11 @@ class Spells(DataSource):
             dmgdice = ""
             dmgtype = ""
             if 'damageInflict' in spell:
-                try:
-                    dmgdice = dmg_die.findall(str(spell["entries"]))[0]
-                except IndexError:
-                    pass
+                for text in _strings(spell["entries"]):
+                    match = DMG_DIE.search(text)
+                    if match:
+                        dmgdice = match.group(0)
+                        break
                 dmgtype = ','.join(spell['damageInflict'])
 
             duration = ""
@@ -171,26 +220,39 @@ class Spells(DataSource):
                     ]
                 }
             )
+        self.data = {key: members for key, members in self.data.items() if members}
         self.metadata = {"headers": headers}
 
-    @property
-    def as_yaml(self) -> str:
-        return yaml.dump({"metadata": self.metadata}) + yaml.dump(dict(self.data))
 
+@lru_cache(maxsize=None)
+def weapons(source_path: str = "items-base.json") -> Weapons:
+    """
+    Parse the 5e.tools base items. The result is cached and shared between
+    callers, so treat it as read-only.
+    """
+    return Weapons(source=(sources / Path(source_path)).read_bytes())
 
-def weapons(source_path: str = "items-base.json") -> dict:
-    with open(sources / Path(source_path)) as filehandle:
-        ds = Weapons(source=filehandle)
-        return ds
 
+@lru_cache(maxsize=None)
+def _spells(source: str) -> Spells:
+    """
+    Parse a single 5e.tools spell source, such as 'phb'.
+    """
+    return Spells(source=(sources / Path(f"spells-{source}.json")).read_bytes())
 
-def spells() -> dict:
-    spells = []
-    for source in ['phb', 'ftd', 'scc', 'xge', 'tce']:
-        source_path = sources / Path(f"spells-{source}.json")
-        with open(source_path) as filehandle:
-            spells.append(Spells(source=filehandle))
-    for i in range(1, len(spells)):
-        for level, spell_list in spells[i].data.items():
-            spells[0].data[level] += spell_list
-    return spells[0]
+
+@lru_cache(maxsize=None)
+def spells() -> Spells:
+    """
+    Merge the spells from every supported 5e.tools source. Each source is
+    parsed once and cached independently; the merged result is cached and
+    shared between callers, so treat it as read-only.
+    """
+    parsed = [_spells(source) for source in ['phb', 'ftd', 'scc', 'xge', 'tce']]
+    merged = copy.copy(parsed[0])
+    levels = dict.fromkeys(level for ds in parsed for level in ds.data)
+    merged.data = {
+        level: list(chain.from_iterable(ds.data.get(level, ()) for ds in parsed))
+        for level in levels
+    }
+    return merged
@@ -1,24 +1,60 @@
+import copy
+from functools import cached_property, lru_cache
+
 from dnd_item import types
 from rolltable.tables import spells
 
+# maps maximum spell level to a rarity level (0=common...)
+SPELL_FREQUENCY_BY_RARITY = {
+    'common': 'first',
+    'uncommon': 'third',
+    'rare': 'fifth',
+    'very rare': 'seventh',
+    'legendary': 'ninth'
+}
+
+
+@lru_cache(maxsize=None)
+def spell_table(frequency: str):
+    """
+    Return a one-row copy of the spells rolltable using the specified
+    frequency distribution. Tables are cached, so each frequency is only
+    configured once; call reset() on the result to roll a new spell.
+    """
+    table = copy.deepcopy(spells)
+    table.die = 1
+    table.datasources[0].set_frequency(frequency)
+    return table
+
+
+@lru_cache(maxsize=None)
+def spell_keys() -> tuple:
+    """
+    Return the attribute names for a spell rolled from the spells rolltable,
+    derived from the table's headers ('Damage Die' becomes 'damage_die').
+    """
+    return tuple(h.lower().replace(' ', '_') for h in spells.headers)
+
 
 class Scroll(types.Item):
     """
     A magic scroll.
     """
 
-    @property
+    @cached_property
     def name(self):
-        return 'Scroll of {spell.name}'.format(**self).title()
+        return f"Scroll of {self.spell.name}".title()
 
-    @property
+    @cached_property
     def summary(self):
         if self.spell.level == 'cantrip':
             return f"{self.name} ({self.spell.school} {self.spell.level})"
         else:
             return f"{self.name} ({self.spell.level} level {self.spell.school})"
 
-    details = summary
+    @property
+    def details(self):
+        return self.summary
 
 
 class ScrollGenerator(types.ItemGenerator):
@@ -30,22 +66,11 @@ class ScrollGenerator(types.ItemGenerator):
         """
         item = super().random_properties(rarity)
 
-        # maps maximum spell level to a rarity level (0=common...)
-        frequencies = {
-            'common': 'first',
-            'uncommon': 'third',
-            'rare': 'fifth',
-            'very rare': 'seventh',
-            'legendary': 'ninth'
-        }
-
-        # Create a rolltable of spells at an appropriate level with one row
-        spells.reset()
-        spells.die = 1
-        spells.datasources[0].set_frequency(frequencies[item['rarity']['rarity']])
-
-        # add the spell to the item as a dictionary
-        keys = [h.lower().replace(' ', '_') for h in spells.headers]
-        item['spell'] = dict(zip(*[keys, spells.rows[1][1:]]))
+        # Roll a spell at an appropriate level
+        table = spell_table(SPELL_FREQUENCY_BY_RARITY[item['rarity']['rarity']])
+        table.reset()
+
+        # add the spell to the item as a dictionary, skipping the roll column
+        item['spell'] = dict(zip(spell_keys(), table.rows[1][1:]))
 
         return item
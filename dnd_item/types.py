@@ -1,31 +1,120 @@
+import bisect
+import heapq
 import logging
 import random
 import re
+import string
 from collections.abc import Mapping
 from dataclasses import dataclass, field
+from functools import cached_property, lru_cache
+from itertools import accumulate
 from pathlib import Path
+from types import MappingProxyType
 
 import rolltable.types
 from random_sets.sets import DataSourceSet, WeightedSet
 
-# Create DataSourceSets, which are WeightedSets populated with DataSource
-# objects generated from yaml data files. These are used to supply default
-# values to item generators; see below.
+# DataSourceSets, which are WeightedSets populated with DataSource objects
+# generated from yaml data files, are used to supply default values to item
+# generators; see below. They are available as module attributes, but each
+# file is only parsed the first time it is used; see __getattr__().
 sources = Path(__file__).parent / Path("sources")
-ENCHANTMENT = DataSourceSet(sources / Path("magic_damage_types.yaml"))
-WEAPON_TYPES = DataSourceSet(sources / Path("weapons.yaml"))
-RARITY = DataSourceSet(sources / Path("rarity.yaml"))
-PROPERTIES_BY_RARITY = {
-    "base": DataSourceSet(sources / Path("properties_base.yaml")),
-    "common": DataSourceSet(sources / Path("properties_common.yaml")),
-    "uncommon": DataSourceSet(sources / Path("properties_uncommon.yaml")),
-    "rare": DataSourceSet(sources / Path("properties_rare.yaml")),
-    "very rare": DataSourceSet(sources / Path("properties_very_rare.yaml")),
-    "legendary": DataSourceSet(sources / Path("properties_legendary.yaml")),
+SOURCE_FILES = {
+    "ENCHANTMENT": "magic_damage_types.yaml",
+    "WEAPON_TYPES": "weapons.yaml",
+    "RARITY": "rarity.yaml",
+}
+PROPERTY_FILES_BY_RARITY = {
+    "base": "properties_base.yaml",
+    "common": "properties_common.yaml",
+    "uncommon": "properties_uncommon.yaml",
+    "rare": "properties_rare.yaml",
+    "very rare": "properties_very_rare.yaml",
+    "legendary": "properties_legendary.yaml",
 }
 
 
-@dataclass
+@lru_cache(maxsize=None)
+def load_source(filename: str) -> DataSourceSet:
+    """
+    Return the DataSourceSet for a yaml file in the sources directory. Each
+    file is parsed once, and the result is shared between callers.
+    """
+    return DataSourceSet(sources / Path(filename))
+
+
+@lru_cache(maxsize=None)
+def _properties_by_rarity() -> dict:
+    return {rarity: load_source(filename) for rarity, filename in PROPERTY_FILES_BY_RARITY.items()}
+
+
+def __getattr__(name: str):
+    """
+    Load the default DataSourceSets (ENCHANTMENT, WEAPON_TYPES, RARITY and
+    PROPERTIES_BY_RARITY) on first access.
+    """
+    if name in SOURCE_FILES:
+        return load_source(SOURCE_FILES[name])
+    if name == "PROPERTIES_BY_RARITY":
+        return _properties_by_rarity()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# The rarity frequency distributions defined in rarity.yaml, and the lowest
+# challenge rating to which each non-default distribution applies. Challenge
+# ratings below 1 use the default distribution. See ItemGenerator.random().
+CHALLENGE_RATINGS = (1, 5, 11, 17)
+RARITY_FREQUENCIES = ("default", "1-4", "5-10", "11-16", "17")
+
+# Given "{foo.bar.baz}", capture "foo"
+REQUIREMENT_PATTERN = re.compile(r"{([^\.\}]+)")
+
+
+@lru_cache(maxsize=4096)
+def compile_template(template: str) -> tuple:
+    """
+    Parse a template string and return the names of the attributes it
+    references. Results are cached, since the same handful of templates are
+    formatted for every item generated.
+
+        >>> compile_template("{info.owner} owns this {length}ft. pole")
+        ('info', 'length')
+    """
+    names = []
+    for _, field_name, _, _ in string.Formatter().parse(template):
+        if field_name is not None:
+            names.append(re.split(r"[.\[]", field_name, maxsplit=1)[0])
+    return tuple(dict.fromkeys(names))
+
+
+def render_template(template: str, attributes: Mapping, **kwargs) -> str:
+    """
+    Format a template string using values from attributes and kwargs. This is
+    equivalent to template.format(**attributes, **kwargs), except that only
+    the referenced attributes are looked up, rather than copying all of them.
+    """
+    values = {}
+    for name in compile_template(template):
+        values[name] = kwargs[name] if name in kwargs else attributes[name]
+    return template.format_map(values)
+
+
+def _may_contain_template(value) -> bool:
+    """
+    Return True if value is a template string, or a dict or other object
+    whose string representation includes one. Dicts always return True.
+    """
+    if type(value) is str:
+        return "{" in value
+    if isinstance(value, (dict, AttributeMap)):
+        # the string representation of a mapping always includes a brace.
+        return True
+    if value is None or type(value) in (int, float, bool):
+        return False
+    return "{" in str(value)
+
+
+@dataclass(slots=True)
 class AttributeMap(Mapping):
     """
     AttributeMap is a data class that is also a mapping, converting a dict
@@ -67,9 +156,10 @@ class AttributeMap(Mapping):
     attributes: field(default_factory=dict)
 
     def __getattr__(self, attr):
-        if attr in self.attributes:
+        try:
             return self.attributes[attr]
-        return self.__getattribute__(attr)
+        except KeyError:
+            return self.__getattribute__(attr)
 
     def __len__(self):
         return len(self.attributes)
@@ -85,15 +175,82 @@ class AttributeMap(Mapping):
         """
         Create a new AttributeMap object using keyword arguments. Dicts are
         recursively converted to AttributeMap objects; everything else is
-        passed as-is.
+        passed as-is. Keys keep the order of the dict.
+
+        AttributeMaps created from flat dicts of hashable values are cached
+        and shared between callers, so their attributes are read-only.
         """
+        if cls is AttributeMap:
+            try:
+                key = tuple((k, type(v), v) for k, v in kwargs.items())
+                return _cached_attribute_map(key)
+            except TypeError:
+                # the dict contains dicts, lists, or other unhashable values.
+                pass
         attrs = {}
-        for k, v in sorted(kwargs.items()):
+        for k, v in kwargs.items():
             attrs[k] = AttributeMap.from_dict(v) if type(v) is dict else v
         return cls(attributes=attrs)
 
 
-@dataclass
+@lru_cache(maxsize=2048)
+def _cached_attribute_map(key: tuple) -> AttributeMap:
+    """
+    Create an AttributeMap from a tuple of (key, type, value) members. The
+    type is part of the cache key so that, for example, 1 and True do not
+    share an entry. The attributes are a read-only view, so that no caller
+    can change the instance out from under the others.
+    """
+    return AttributeMap(attributes=MappingProxyType({k: v for k, _, v in key}))
+
+
+def _format_dict(obj: dict, attributes: dict, this) -> AttributeMap:
+    # dicts are descended into, with 'this' referring to the dict itself. The
+    # dict is not modified in place, as property definitions are shared
+    # between items.
+    return AttributeMap.from_dict(
+        dict(
+            (_format(key, attributes, this=obj), _format(val, attributes, this=obj))
+            for key, val in obj.items()
+        )
+    )
+
+
+def _format_list(obj: list, attributes: dict, this) -> list:
+    return [_format(o, attributes, this=this) for o in obj]
+
+
+def _format_str(obj: str, attributes: dict, this) -> str:
+    # Strings are formatted wth values from attributes and this. Using
+    # attributes is important here, so that values containing template
+    # strings are processed before they are referenced. Most strings are
+    # literals, though, which need no formatting at all.
+    if "{" not in obj:
+        return obj
+    # 'this' is only converted to an AttributeMap for the templates that use
+    # it, rather than for every dict that is formatted.
+    if this is not None and "this" in compile_template(obj):
+        this = AttributeMap.from_dict(this)
+    return render_template(obj, attributes, this=this)
+
+
+# The formatters used by _format(), by type. Any other type is returned unaltered.
+_FORMATTERS = {dict: _format_dict, list: _format_list, str: _format_str}
+
+
+def _format(obj, attributes: dict, this=None):
+    """
+    Recursively locate and populate template strings in obj, using the
+    values of attributes. Dicts are converted to AttributeMaps.
+
+    The 'this' keyword refers to the dict currently being formatted, if any,
+    as an AttributeMap; refer to the enchantment sources for an example.
+    """
+    formatter = _FORMATTERS.get(type(obj))
+    return formatter(obj, attributes, this) if formatter else obj
+
+
+@dataclass(slots=True)
 class Item(AttributeMap):
     """
     Item is the base class for items, weapons, and spells, and is intended to
@@ -187,11 +344,15 @@ class Item(AttributeMap):
         """
         Summarize the properties of the item, as defined by Item.properties.
         """
-        desc = "\n".join([
-            k.title() + ". " + v.get('description', '')
-            for k, v in self.get("properties", {}).items()
-        ])
-        return desc.format(**self)
+        # Property descriptions were formatted when the item was created, but
+        # the values substituted into them may themselves contain templates.
+        parts = []
+        for k, v in self.get("properties", {}).items():
+            desc = v.get('description', '')
+            if "{" in desc:
+                desc = render_template(desc, self)
+            parts.append(k.title() + ". " + desc)
+        return "\n".join(parts)
 
     @classmethod
     def from_dict(cls, attrs: dict):
@@ -202,53 +363,31 @@ class Item(AttributeMap):
 
         attributes = dict()
 
-        # recursively locate and populate template strings
-        def _format(obj, this=None):
-            # enables use of the 'this' keyword to refer to the current context
-            # in a template. Refer to the enchantment sources for an example.
-            if this:
-                this = AttributeMap.from_dict(this)
-
-            # dicts and lists are descended into
-            if type(obj) is dict:
-                return AttributeMap.from_dict(
-                    dict(
-                        (_format(key, this=obj), _format(val, this=obj))
-                        for key, val in obj.items()
-                    )
-                )
-
-            if type(obj) is list:
-                return [_format(o, this=this) for o in obj]
-
-            # Strings are formatted wth values from attributes and this. Using
-            # attributes is important here, so that values containing template
-            # strings are processed before they are referenced.
-            if type(obj) is str:
-                return obj.format(**attributes, this=this)
-
-            # Any type other than dict, list, and string is returned unaltered.
-            return obj
-
         properties = attrs.pop("properties", {})
 
         # apply property overrides overrides before anything else
         for prop in properties.values():
-            overrides = [k for k in prop.keys() if k.startswith("override_")]
-            for o in overrides:
-                if prop[o]:
-                    attrs[o.replace("override_", "")] = prop[o]
-
-        # step through the supplied attributes and format each member.
-        for k, v in sorted(attrs.items(), key=lambda i: '{' in f"{i[0]}{i[1]}"):
-            if type(v) is dict:
-                attributes[k] = AttributeMap.from_dict(_format(v))
+            for key, value in prop.items():
+                if value and key.startswith("override_"):
+                    attrs[key.removeprefix("override_")] = value
+
+        # step through the supplied attributes and format each member. Members
+        # without template strings need no formatting, and are added first so
+        # that they can be referenced by the others. Dicts are returned from
+        # _format() as AttributeMaps already.
+        templated = []
+        for k, v in attrs.items():
+            if "{" in k or _may_contain_template(v):
+                templated.append((k, v))
             else:
-                attributes[k] = _format(v)
+                attributes[k] = list(v) if type(v) is list else v
+        for k, v in templated:
+            attributes[k] = _format(v, attributes)
 
-        # process properties now that we have preprocessed everything else
+        # process properties now that we have preprocessed everything else.
+        # They are sorted by name, which is the order the description uses.
         if properties:
-            attributes["properties"] = AttributeMap.from_dict(_format(properties))
+            attributes["properties"] = _format(dict(sorted(properties.items())), attributes)
 
         # store the item name as the _name attribute; it is accessable directly, or
         # via the name property. This makes overriding the name convenient for subclassers,
@@ -318,11 +457,50 @@ class ItemGenerator:
     # override this with a subclass of Item.
     item_class = Item
 
+    # The distribution of the number of properties to add to items of each
+    # rarity, as (count, weight) pairs; see _property_count_by_rarity().
+    property_count_by_rarity = {
+        "common": ((1, 0.1), (0, 1.0)),
+        "uncommon": ((1, 1.0),),
+        "rare": ((1, 1.0), (2, 0.5)),
+        "very rare": ((1, 0.5), (2, 1.0)),
+        "legendary": ((2, 1.0), (3, 1.0)),
+    }
+
     def __init__(self, bases: WeightedSet = None, rarity: WeightedSet = None, properties_by_rarity: dict = None):
         self.bases = bases or WeightedSet((dict(name=self.__class__.__name__), 1.0))
-        self.rarity = rarity or RARITY
+        self.rarity = rarity or load_source(SOURCE_FILES["RARITY"])
         self.properties_by_rarity = properties_by_rarity
 
+        # the base properties are looked up by name for every item generated.
+        if properties_by_rarity and "base" in properties_by_rarity:
+            self.base_properties = properties_by_rarity["base"].source.as_dict()
+        else:
+            self.base_properties = {}
+
+        # the property counts and their cumulative weights, by rarity, ready
+        # for random.choices().
+        self.property_counts = {
+            name: (tuple(count for count, _ in dist), tuple(accumulate(weight for _, weight in dist)))
+            for name, dist in self.property_count_by_rarity.items()
+        }
+
+        # the (definition, weight) pairs random properties are sampled from, by
+        # rarity; see random_properties(). Properties with no weight can never
+        # be selected, so they are left out.
+        self.property_pools = {
+            name: tuple((member, weight) for member, weight in zip(pool.members, pool.weights) if weight > 0)
+            for name, pool in (properties_by_rarity or {}).items()
+        }
+
+    @cached_property
+    def rarities(self) -> dict:
+        """
+        The rarity definitions, by name. Used when random() is asked for items
+        of a specific rarity.
+        """
+        return self.rarity.source.as_dict()
+
     def _property_count_by_rarity(self, rarity: str) -> int:
         """
         Return a number of properties to add to an item of some rarity. Common items
@@ -333,19 +511,12 @@ class ItemGenerator:
         if not self.properties_by_rarity:
             return 0
 
-        property_count_by_rarity = {
-            "common": WeightedSet((1, 0.1), (0, 1.0)),
-            "uncommon": WeightedSet((1, 1.0)),
-            "rare": WeightedSet((1, 1.0), (2, 0.5)),
-            "very rare": WeightedSet((1, 0.5), (2, 1.0)),
-            "legendary": WeightedSet((2, 1.0), (3, 1.0)),
-        }
-
         # don't try to apply more unique properties to the item than exist in
         # the look-up tables.
+        counts, cum_weights = self.property_counts[rarity]
         return min(
-            property_count_by_rarity[rarity].random(),
-            len(self.properties_by_rarity[rarity].members)
+            random.choices(counts, cum_weights=cum_weights)[0],
+            len(self.property_pools[rarity])
         )
 
     def _get_requirements(self, item) -> set:
@@ -358,22 +529,17 @@ class ItemGenerator:
             >>> ItemGenerator()._get_requirements(props)
             {'one', 'two'}
         """
-
-        # Given "{foo.bar.baz}", capture "foo"
-        pat = re.compile(r"{([^\.\}]+)")
-
-        def getreqs(obj):
+        requirements = set()
+        stack = [item]
+        while stack:
+            obj = stack.pop()
             if type(obj) is dict:
-                for val in obj.values():
-                    yield from getreqs(val)
+                stack.extend(obj.values())
             elif type(obj) is list:
-                yield from [getreqs(o) for o in obj]
-            elif type(obj) is str:
-                matches = pat.findall(obj)
-                if matches:
-                    yield from matches
-
-        return set(getreqs(item))
+                stack.extend(obj)
+            elif type(obj) is str and "{" in obj:
+                requirements.update(REQUIREMENT_PATTERN.findall(obj))
+        return requirements
 
     def random_properties(self, rarity: str = '') -> dict:
         """
@@ -409,18 +575,25 @@ class ItemGenerator:
 
         # select a random rarity
         if rarity:
-            item["rarity"] = self.rarity.source.as_dict()[rarity]
+            item["rarity"] = self.rarities[rarity]
         else:
             item['rarity'] = self.rarity.random()
 
         # select a number of properties appropriate to the rarity
-        num_properties = self._property_count_by_rarity(item["rarity"]["rarity"])
+        rarity = item["rarity"]["rarity"]
+        num_properties = self._property_count_by_rarity(rarity)
 
-        # generate the selected number of properties
+        # generate the selected number of properties, without duplicates. This
+        # is a weighted sample without replacement: each property gets a random
+        # key of u ** (1 / weight), and the properties with the largest keys win.
         properties = {}
-        while len(properties) != num_properties:
-            thisprop = self.properties_by_rarity[item["rarity"]["rarity"]].random()
-            properties[thisprop["name"]] = thisprop
+        if num_properties:
+            for prop, _ in heapq.nlargest(
+                num_properties,
+                self.property_pools[rarity],
+                key=lambda pair: random.random() ** (1 / pair[1]),
+            ):
+                properties[prop["name"]] = prop
 
         # Base items might have properties already; weapons have things like
         # 'versatile' and 'two-handed', for example. We'll add these to the
@@ -429,7 +602,7 @@ class ItemGenerator:
         for name in item.pop("properties", "").split(","):
             name = name.strip()
             if name:
-                properties[name] = self.properties_by_rarity["base"].source.as_dict()[name]
+                properties[name] = self.base_properties[name]
 
         item["properties"] = properties
 
@@ -460,21 +633,13 @@ class ItemGenerator:
         case challenge_rating is ignored.
         """
         if not rarity:
-            if challenge_rating in range(1, 5):
-                frequency = "1-4"
-            elif challenge_rating in range(5, 11):
-                frequency = "5-10"
-            elif challenge_rating in range(11, 17):
-                frequency = "11-16"
-            elif challenge_rating >= 17:
-                frequency = "17"
-            else:
-                frequency = "default"
+            frequency = RARITY_FREQUENCIES[bisect.bisect_right(CHALLENGE_RATINGS, challenge_rating)]
+            # the rarity set is shared between generators, so the distribution
+            # is set on every call rather than only when it changes.
             self.rarity.set_frequency(frequency)
-        items = []
-        for _ in range(count):
-            items.append(self.item_class.from_dict(self.random_properties(rarity=rarity)))
-        return items
+        from_dict = self.item_class.from_dict
+        random_properties = self.random_properties
+        return [from_dict(random_properties(rarity=rarity)) for _ in range(count)]
 
 
 @dataclass
@@ -487,14 +652,14 @@ class GeneratorSource:
     cr: int
 
     def random_values(self, count: int = 1) -> list:
-        vals = sorted(
-            (
-                item.rarity["sort_order"],
-                [item.name, item.rarity["rarity"], item.summary, ", ".join(item.get("properties", [])), item.id],
-            )
-            for item in self.generator.random(count=count, challenge_rating=self.cr)
+        items = sorted(
+            self.generator.random(count=count, challenge_rating=self.cr),
+            key=lambda item: item.rarity["sort_order"],
         )
-        return [v[1] for v in vals]
+        return [
+            [item.name, item.rarity["rarity"], item.summary, ", ".join(item.get("properties", [])), item.id]
+            for item in items
+        ]
 
 
 class RollTable(rolltable.types.RollTable):
@@ -1,18 +1,46 @@
 import base64
 import hashlib
 import random
-from functools import cached_property
+from functools import cached_property, lru_cache
 
-from random_sets.sets import WeightedSet, equal_weights
+from random_sets.sets import WeightedSet
 
 from dnd_item import types
 
 
+@lru_cache(maxsize=1024)
+def split_csv(csv: str) -> tuple:
+    """
+    Split a comma-separated value string into a tuple of stripped values. The
+    results are cached, since the same few strings from the property and
+    enchantment sources are split for every weapon generated.
+    """
+    return tuple(value.strip() for value in csv.split(","))
+
+
 def random_from_csv(csv: str) -> str:
     """
     Split a comma-separated value string into a list and return a random value.
     """
-    return random.choice(csv.split(",")).strip()
+    return random.choice(split_csv(csv))
+
+
+@lru_cache(maxsize=None)
+def name_templates(with_adjectives: bool, with_nouns: bool, multiple_properties: bool) -> tuple:
+    """
+    Return the name templates suitable for a weapon with the given descriptors,
+    and their weights, as a pair of tuples. See Weapon._name_template().
+    """
+    options = []
+    if with_nouns and not with_adjectives:
+        options.append(("{name} of {nouns}", 0.5))
+    if with_adjectives and not with_nouns:
+        options.append(("{adjectives} {name}", 0.5))
+    if with_nouns and with_adjectives:
+        options.append(("{adjectives} {name} of {nouns}", 1.0))
+        if multiple_properties:
+            options.append(("{name} of {adjectives} {nouns}", 0.5))
+    return tuple(zip(*options))
 
 
 class Weapon(types.Item):
@@ -21,28 +49,30 @@ class Weapon(types.Item):
 
     Much of this subclass is devoted to generating descriptive and entertaining
     weapon names. It also implements a number of handy properties for presentation.
+    A Weapon does not change once it has been created, so these are cached.
     """
 
-    def _descriptors(self) -> tuple:
+    @cached_property
+    def _descriptors(self) -> dict:
         """
         Collect the 'nouns' and 'adjectives' properties from the Item's
-        'properties' attribute. This is used by _random_descriptors to choose a
-        set of random nouns and adjectives to apply to a weapon name.
+        'properties' attribute, as a dict of (nouns, adjectives) tuples of words
+        keyed by property name. Either member of the pair may be None, but properties
+        with neither are omitted. This is used by _random_descriptors to choose
+        a set of random nouns and adjectives to apply to a weapon name, and is
+        cached since the properties of a Weapon do not change.
         """
-        nouns = dict()
-        adjectives = dict()
-        if not hasattr(self, "properties"):
-            return (nouns, adjectives)
-        for prop_name, prop in self.properties.items():
-            if hasattr(prop, "nouns"):
-                nouns[prop_name] = equal_weights(prop.nouns.split(","), blank=False)
-            if hasattr(prop, "adjectives"):
-                adjectives[prop_name] = equal_weights(prop.adjectives.split(","), blank=False)
-        return (nouns, adjectives)
+        descriptors = dict()
+        for prop_name, prop in self.attributes.get("properties", {}).items():
+            nouns = split_csv(prop["nouns"]) if "nouns" in prop else None
+            adjectives = split_csv(prop["adjectives"]) if "adjectives" in prop else None
+            if nouns is not None or adjectives is not None:
+                descriptors[prop_name] = (nouns, adjectives)
+        return descriptors
 
     def _name_template(self, with_adjectives: bool, with_nouns: bool) -> str:
         """
-        Generate a WeightedSet of potential name template strings and pick one.
+        Choose a name template string at random from a weighted set of options.
 
         The possible templates are determined by whether we have selected
         nouns, adjectives, or both to describe the item; we can't use a
@@ -55,23 +85,10 @@ class Weapon(types.Item):
         of Mighty Striking") or repeitive descriptions ("Flaming Spear of
         Flames"), but not so often as to make all generated items too silly.
         """
-        num_properties = len(self.properties)
-        options = []
-        if with_nouns and not with_adjectives:
-            options.append(("{name} of {nouns}", 0.5))
-        if with_adjectives and not with_nouns:
-            options.append(("{adjectives} {name}", 0.5))
-        if with_nouns and with_adjectives:
-            if num_properties == 1:
-                options.append(("{adjectives} {name} of {nouns}", 1.0))
-            elif num_properties > 1:
-                options.extend(
-                    [
-                        ("{adjectives} {name} of {nouns}", 1.0),
-                        ("{name} of {adjectives} {nouns}", 0.5),
-                    ]
-                )
-        return WeightedSet(*options).random()
+        templates, weights = name_templates(with_adjectives, with_nouns, len(self.properties) > 1)
+        if len(templates) == 1:
+            return templates[0]
+        return random.choices(templates, weights=weights)[0]
 
     def _random_descriptors(self):
         """
@@ -88,28 +105,25 @@ class Weapon(types.Item):
         random_nouns = []
         random_adjectives = []
 
-        (nouns, adjectives) = self._descriptors()
-        if not (nouns or adjectives):
+        descriptors = self._descriptors
+        if not descriptors:
             return (random_nouns, random_adjectives)
 
-        def add_word(key, obj, source):
-            obj.append(source[key].random().strip())
-
-        seen_nouns = dict()
-        for prop_name in set(list(nouns.keys()) + list(adjectives.keys())):
+        seen_nouns = set()
+        for prop_name, (nouns, adjectives) in descriptors.items():
 
-            if prop_name in nouns and prop_name not in adjectives:
+            if adjectives is None:
                 if prop_name not in seen_nouns:
                     # Ensure we only add one noun for each property so taht we
                     # don't end up with Items named like "Mace of Venomous
                     # Venom Poison".
-                    add_word(prop_name, random_nouns, nouns)
-                    seen_nouns[prop_name] = True
+                    random_nouns.append(random.choice(nouns))
+                    seen_nouns.add(prop_name)
 
-            elif prop_name in adjectives and prop_name not in nouns:
-                add_word(prop_name, random_adjectives, adjectives)
+            elif nouns is None:
+                random_adjectives.append(random.choice(adjectives))
 
-            if prop_name in nouns and prop_name in adjectives:
+            else:
                 # if the property has both nouns and adjectives, select one
                 # or the other or both, for the weapon name. Both leads to
                 # spurious names like 'thundering dagger of thunder', so we
@@ -117,13 +131,13 @@ class Weapon(types.Item):
                 # occasionl bit of silliness, not consistently silly.
                 val = random.random()
                 if val <= 0.4 and prop_name not in seen_nouns:
-                    add_word(prop_name, random_nouns, nouns)
-                    seen_nouns[prop_name] = True
+                    random_nouns.append(random.choice(nouns))
+                    seen_nouns.add(prop_name)
                 elif val <= 0.8:
-                    add_word(prop_name, random_adjectives, adjectives)
+                    random_adjectives.append(random.choice(adjectives))
                 else:
-                    add_word(prop_name, random_nouns, nouns)
-                    add_word(prop_name, random_adjectives, adjectives)
+                    random_nouns.append(random.choice(nouns))
+                    random_adjectives.append(random.choice(adjectives))
 
         # Join multiple nouns together, so that instead of "Staff of Strikes
         # Cold" we get "Staff of Strikes and Cold." Adjectives we just join
@@ -145,6 +159,9 @@ class Weapon(types.Item):
         to self.name to return different values on the same instance.
         """
         base_name = super().name
+        if not self._descriptors:
+            return base_name
+
         (nouns, adjectives) = self._random_descriptors()
         if not (nouns or adjectives):
             return base_name
@@ -153,9 +170,10 @@ class Weapon(types.Item):
             with_adjectives=True if adjectives else False,
             with_nouns=True if nouns else False,
         )
-        return template.format(**self, adjectives=adjectives, nouns=nouns, name=base_name).title()
+        # name templates only ever refer to these three fields.
+        return template.format(adjectives=adjectives, nouns=nouns, name=base_name).title()
 
-    @property
+    @cached_property
     def to_hit(self):
         """
         Return a string summarizing the total bonus to hit from this weapon and its properties. This
@@ -163,10 +181,11 @@ class Weapon(types.Item):
         """
         bonus_val = 0
         bonus_dice = ""
-        if not hasattr(self, "properties"):
+        properties = self.attributes.get("properties")
+        if properties is None:
             return ""
-        for prop in self.properties.values():
-            mod = getattr(prop, "to_hit", None)
+        for prop in properties.values():
+            mod = prop.attributes.get("to_hit")
             if not mod:
                 continue
             if type(mod) is int:
@@ -175,7 +194,7 @@ class Weapon(types.Item):
                 bonus_dice += f"+{mod}"
         return f"+{bonus_val}{bonus_dice}"
 
-    @property
+    @cached_property
     def damage_dice(self):
         """
         Return a string summarizing the damage done by a hit with this weapon
@@ -186,24 +205,23 @@ class Weapon(types.Item):
             - 1d8+1 Thunder
             - 1d6+1 Slashing + 1d4 Thunder + 3 Poison
         """
-        if not hasattr(self, "properties"):
+        properties = self.attributes.get("properties")
+        if properties is None:
             return ""
-        dmg = {self.damage_type: str(self.damage) or ""}
+        # collect the damage dice by damage type, and join them at the end.
+        base_damage = str(self.damage)
+        dmg = {self.damage_type: [base_damage] if base_damage else []}
 
-        for prop in self.properties.values():
-            mod = getattr(prop, "damage", None)
+        for prop in properties.values():
+            attributes = prop.attributes
+            mod = attributes.get("damage")
             if not mod:
                 continue
-            key = str(prop.damage_type)
-            this_damage = dmg.get(key, "")
-            if this_damage:
-                dmg[key] = f"{this_damage}+{mod}"
-            else:
-                dmg[key] = mod
+            dmg.setdefault(str(attributes["damage_type"]), []).append(str(mod))
 
-        return " + ".join([f"{v} {k}" for k, v in dmg.items()])
+        return " + ".join([f"{'+'.join(dice)} {damage_type}" for damage_type, dice in dmg.items()])
 
-    @property
+    @cached_property
     def summary(self):
         """
         Return a one-line summary of the Weapon's attack. For example:
@@ -212,19 +230,17 @@ class Weapon(types.Item):
         """
         return f"{self.to_hit} to hit, {self.range} ft., {self.targets} tgts. {self.damage_dice}"
 
-    @property
+    @cached_property
     def details(self):
         """
         Return details of the Weapon as a multi-line string.
         """
         props = ", ".join(self.get("properties", dict()).keys())
-        return "\n".join(
-            [
-                f"{self.name}",
-                f" * {self.rarity.rarity} {self.category} weapon ({props})",
-                f" * {self.summary}",
-                f"\n{self.description}\n",
-            ]
+        return (
+            f"{self.name}\n"
+            f" * {self.rarity.rarity} {self.category} weapon ({props})\n"
+            f" * {self.summary}\n"
+            f"\n{self.description}\n"
         )
 
     @cached_property
@@ -239,15 +255,7 @@ class Weapon(types.Item):
         be helpful when (for example) generating weapon look-up tables,
         web pages, item cards, and so on.
         """
-        sha1bytes = hashlib.sha1(
-            "".join(
-                [
-                    self._name,
-                    self.to_hit,
-                    self.damage_dice,
-                ]
-            ).encode()
-        )
+        sha1bytes = hashlib.sha1(f"{self._name}{self.to_hit}{self.damage_dice}".encode())
 
         # Only use the first ten characteres of the encoded value. This
         # increases the likelihood of hash collisions, but 10 characters is far
@@ -265,11 +273,15 @@ class WeaponGenerator(types.ItemGenerator):
 
     def __init__(
         self,
-        bases: WeightedSet = types.WEAPON_TYPES,
-        rarity: WeightedSet = types.RARITY,
-        properties_by_rarity: dict = types.PROPERTIES_BY_RARITY,
+        bases: WeightedSet = None,
+        rarity: WeightedSet = None,
+        properties_by_rarity: dict = None,
     ):
-        super().__init__(bases=bases, rarity=rarity, properties_by_rarity=properties_by_rarity)
+        super().__init__(
+            bases=types.WEAPON_TYPES if bases is None else bases,
+            rarity=types.RARITY if rarity is None else rarity,
+            properties_by_rarity=types.PROPERTIES_BY_RARITY if properties_by_rarity is None else properties_by_rarity,
+        )
 
     def random_properties(self, rarity: str = '') -> dict:
         # add missing base weapon defaults
@@ -288,6 +300,5 @@ class WeaponGenerator(types.ItemGenerator):
         by a template string.
         """
         prop = types.ENCHANTMENT.random()
-        prop["adjectives"] = random_from_csv(prop["adjectives"])
-        prop["nouns"] = random_from_csv(prop["nouns"])
-        return prop
+        # split_csv() caches the word lists, so random_from_csv() only has to pick one.
+        return dict(prop, adjectives=random_from_csv(prop["adjectives"]), nouns=random_from_csv(prop["nouns"]))
@@ -1,4 +1,31 @@
-from dnd_item import types
+import random
+from collections import Counter
+
+import pytest
+
+from dnd_item import types, weapons
+
+
+def test_sources_loaded_once():
+    assert types.RARITY is types.load_source('rarity.yaml')
+    assert types.PROPERTIES_BY_RARITY is types.PROPERTIES_BY_RARITY
+
+
+def test_shared_rarity_frequency(monkeypatch):
+    calls = []
+    set_frequency = types.RARITY.set_frequency
+
+    def record(frequency):
+        calls.append(frequency)
+        set_frequency(frequency)
+
+    monkeypatch.setattr(types.RARITY, 'set_frequency', record)
+    first = types.ItemGenerator(rarity=types.RARITY)
+    second = types.ItemGenerator(rarity=types.RARITY)
+    first.random(count=0, challenge_rating=1)
+    second.random(count=0, challenge_rating=17)
+    first.random(count=0, challenge_rating=1)
+    assert calls == ['1-4', '17', '1-4']
 
 
 def test_AttributeMap():
@@ -12,6 +39,13 @@ def test_AttributeMap_nested():
     assert amap.foo.boz is False
 
 
+def test_AttributeMap_cached():
+    assert types.AttributeMap.from_dict({'foo': 1}) is types.AttributeMap.from_dict({'foo': 1})
+    assert types.AttributeMap.from_dict({'foo': True}).foo is True
+    with pytest.raises(TypeError):
+        types.AttributeMap.from_dict({'foo': 1}).attributes['foo'] = 2
+
+
 def test_AttributeMap_list():
     amap = types.AttributeMap(attributes={'foo': True, 'bar': False})
     assert list(amap.attributes.keys()) == ['foo', 'bar']
@@ -23,6 +57,24 @@ def test_AttributeMap_mapping():
     assert '{foo}, {bar}'.format(**amap) == 'True, False'
 
 
+def test_AttributeMap_slots():
+    amap = types.AttributeMap(attributes={'foo': True})
+    assert not hasattr(amap, '__dict__')
+    assert not hasattr(types.Item(attributes={}), '__dict__')
+
+
+def test_compile_template():
+    assert types.compile_template('{info.owner} owns this {length}ft. pole, {length}') == ('info', 'length')
+    assert types.compile_template('{{literal}}') == ()
+
+
+def test_render_template():
+    amap = types.AttributeMap.from_dict({'info': {'owner': 'Jules'}, 'length': 10, 'unused': 1})
+    this = types.AttributeMap(attributes={'name': 'Pole'})
+    template = '{this.name}: {info.owner}, {length}ft.'
+    assert types.render_template(template, amap, this=this) == template.format(**amap, this=this)
+
+
 def test_Item_attributes():
     assert types.Item.from_dict(dict(
         name='{length}ft. Pole',
@@ -63,6 +115,51 @@ def test_Item_overrides():
     assert ten_foot_pole.description == 'Broken. The end of this 10ft. pole has been snapped off.'
 
 
+def test_Item_properties_sorted():
+    attrs = dict(
+        name='Stick',
+        rarity=dict(rarity='rare'),
+        category='Simple',
+        range='',
+        targets=1,
+        damage='1d4',
+        damage_type='Bludgeoning',
+        properties=dict(
+            thrown=dict(description='Throw it.'),
+            light=dict(description='It is light.'),
+            finesse=dict(description='Use Dex.'),
+        )
+    )
+    expected = 'Finesse. Use Dex.\nLight. It is light.\nThrown. Throw it.'
+    assert types.Item.from_dict(dict(attrs)).description == expected
+
+    details = weapons.Weapon.from_dict(dict(attrs)).details
+    assert '(finesse, light, thrown)' in details
+    assert expected in details
+
+
+def test_ItemGenerator_weighted_properties():
+
+    class OnePropertyGenerator(types.ItemGenerator):
+        property_count_by_rarity = {'rare': ((1, 1.0),)}
+
+    properties_by_rarity = {
+        'rare': types.WeightedSet(
+            (dict(name='heavy'), 3.0),
+            (dict(name='light'), 1.0),
+            (dict(name='never'), 0),
+        ),
+    }
+    random.seed(1)
+    picks = Counter()
+    for _ in range(2000):
+        # a new generator for each item, since random_properties() adds to the base.
+        item = OnePropertyGenerator(properties_by_rarity=properties_by_rarity).random_properties(rarity='rare')
+        picks.update(item['properties'].keys())
+    assert 'never' not in picks
+    assert 1350 < picks['heavy'] < 1650
+
+
 def test_ItemGenerator_subclass():
 
     class SharpStickGenerator(types.ItemGenerator):
@@ -86,3 +183,8 @@ def test_ItemGenerator_subclass():
         'glass stick',
     ]
     assert stick[0].rarity.rarity == 'common'
+
+
+def test_ItemGenerator_requirements():
+    props = dict(foo="{one}", bar=dict(baz="{one}", boz="{two.three}"), qux=["{four}", "literal"])
+    assert types.ItemGenerator()._get_requirements(props) == {'one', 'two', 'four'}